@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# ─────────────────────────────────────────────────────────────────────────────
+# services/delb/_terms.py
+# Gemeinsame Bibliographie-Schlagwörter (bibliography_terms.csv) + Regex
+# rev. 2025-05-06
+# ----------------------------------------------------------------------------
+# • CSV wird pro Prozess genau einmal gelesen (Cache-Key = Pfad/mtime/Größe)
+# • Terme: lower-case, dedupliziert, längste zuerst
+# • Regex ohne re.I → immer gegen  txt.lower()  matchen
+# ─────────────────────────────────────────────────────────────────────────────
+from __future__ import annotations
+
+import csv
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple
+
+TERMS_CSV = Path(__file__).with_name("bibliography_terms.csv")
+
+_FALLBACK_TERMS = (                          # Development-Fallback
+    "references", "bibliography", "literatur",
+    "literaturverzeichnis", "works cited",
+    "literature cited", "quellen",
+)
+
+_CsvKey = Tuple[str, int, int]
+
+
+def _csv_key(path: Path = TERMS_CSV) -> _CsvKey:
+    """Günstiger Ersatz für einen Inhalts-Hash: (Pfad, mtime, Größe)."""
+    try:
+        st = path.stat()
+    except OSError:
+        return str(path), 0, 0
+    return str(path), st.st_mtime_ns, st.st_size
+
+
+@lru_cache(maxsize=4)
+def _load(key: _CsvKey) -> Tuple[str, ...]:
+    path = Path(key[0])
+    if not path.exists():
+        terms = set(_FALLBACK_TERMS)
+    else:
+        with path.open(newline="", encoding="utf-8") as fh:
+            terms = {row["term"].strip().lower()
+                     for row in csv.DictReader(fh) if (row.get("term") or "").strip()}
+    return tuple(sorted(terms, key=lambda t: (-len(t), t)))
+
+
+@lru_cache(maxsize=4)
+def _compile(key: _CsvKey) -> re.Pattern[str]:
+    if not _load(key):                       # leere Alternation träfe *jede* Stelle
+        raise ValueError(f"{key[0]}: keine Terme (leer oder Spaltenname ≠ 'term')")
+    return re.compile(r"\b(" + "|".join(map(re.escape, _load(key))) + r")\b")
+
+
+def bib_terms() -> Tuple[str, ...]:
+    """Lower-case Terme aus der CSV (längste zuerst)."""
+    return _load(_csv_key())
+
+
+def bib_regex() -> re.Pattern[str]:
+    """Kompilierte Wortgrenzen-Alternation aller Terme (ohne re.I)."""
+    return _compile(_csv_key())
@@ -8,19 +8,19 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-import csv
 import json
 import logging
 import math
+import multiprocessing
 import os
 import re
 import ssl
-import statistics
 import sys
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import accumulate
 from pathlib import Path
 from time import perf_counter
-from typing import List, Optional, Sequence, Tuple
+from typing import Callable, List, Optional, Sequence, Tuple
 
 import fitz                                 # PyMuPDF
 from dotenv import load_dotenv
@@ -30,6 +30,10 @@ from tqdm import tqdm
 LOG = logging.getLogger("bibdet")
 dbg = LOG.debug
 
+# MuPDF-Warnungen kaputter PDFs nicht pro Seite auf stderr formatieren
+fitz.TOOLS.mupdf_display_errors(False)
+logging.getLogger("fitz").setLevel(logging.ERROR)
+
 
 def _init_log(debug: bool = False) -> None:
     logging.basicConfig(
@@ -65,20 +69,9 @@ def _init_openai() -> None:
 _init_openai()
 
 # ───────────────────────── Terminologie (CSV) ──────────────────────────────
-_TERM_CSV = Path(__file__).with_name("bibliography_terms.csv")
-if _TERM_CSV.exists():
-    with _TERM_CSV.open(newline="", encoding="utf-8") as fp:
-        reader = csv.reader(fp)
-        BIB_TERMS = {cell.strip().lower()
-                     for row in reader for cell in row if cell.strip()}
-else:                                        # Development-Fallback
-    BIB_TERMS = {
-        "references", "bibliography", "literatur",
-        "literaturverzeichnis", "works cited",
-        "literature cited", "quellen"
-    }
-
-_RE_TERMS = re.compile("|".join(map(re.escape, BIB_TERMS)), re.I)
+# gemeinsame Regex mit keyword_hits (lower-case, ohne re.I → gegen txt.lower());
+# bib_regex() ist gecacht → ein reiner Import liest weder CSV noch kompiliert
+from services.delb._terms import bib_regex
 
 # ───────────────────────── Regex-Pools (DOI, Jahr …) ────────────────────────
 _RE_DOI        = re.compile(r"10\.\d{4,9}/[-._;()/:A-Za-z0-9]+", re.I)
@@ -93,6 +86,9 @@ HDR_CAPS_MIN   = 0.45
 CITE_RATIO_THR = 0.30
 MIN_BLOCK_LEN  = 2
 MIN_SCORE_ABS  = 0.45         # Untergrenze für leere Seiten
+SURE_SCORE     = 0.75         # ab hier gilt eine Seite als sicher (GPT-Skip)
+HDR_SCAN_CHARS = 800          # Header-Analyse nur auf den ersten n Zeichen
+_TOK_PUNCT     = ".,;:!?()[]{}\"'«»“”„‘’–-"
 
 # GPT-Feintuning
 _GPT_MODEL  = "gpt-4o-mini"
@@ -100,27 +96,34 @@ _GPT_SYS    = "Only reply BIB if page snippet is bibliography; otherwise NO."
 _GPT_MAXTOK = 1
 
 # ───────────────────────── Heuristik pro Seite ─────────────────────────────
-def _is_cite_line(line: str) -> bool:
-    return bool(
-        _RE_DOI.search(line)
-        or _RE_NUM.match(line)
-        or (_RE_AUTH.match(line) and _RE_YEAR_BARE.search(line))
-        or _RE_YEAR_BARE.search(line)
-    )
+# Ein Treffer pro Zitier-Zeile (NUM am Zeilenanfang, sonst DOI oder Jahr irgendwo);
+# AUTH+Jahr ist durch „Jahr“ bereits abgedeckt.  Läuft mit re.M in *einem*
+# finditer über die ganze Seite statt bis zu 4 Regex-Aufrufen pro Zeile.
+_RE_CITE_LINE = re.compile(
+    r"^(?:\[?\d{1,3}\]?[:.) ]"
+    r"|.*?(?:" + _RE_DOI.pattern + "|" + _RE_YEAR_BARE.pattern + "))",
+    re.M,
+)
 
 def _score_page(txt: str) -> float:
     if not txt.strip():
         return 0.0
 
-    # Header-Analyse
-    hdr   = " ".join(txt.splitlines()[:8])
-    tokens = re.findall(r"\w+", hdr)
+    # Header-Analyse  (nur Seitenanfang – nicht den ganzen Body splitten)
+    hdr   = " ".join(txt[:HDR_SCAN_CHARS].splitlines()[:8])
+    tokens = [w for w in (t.strip(_TOK_PUNCT) for t in hdr.split()) if w.isalnum()]
     caps  = sum(tok.isupper() or tok.istitle() for tok in tokens) / (len(tokens) or 1)
-    hdr_bonus = 1.0 if (_RE_TERMS.search(hdr) and caps >= HDR_CAPS_MIN) else 0.6
+    hdr_bonus = 1.0 if (bib_regex().search(hdr.lower()) and caps >= HDR_CAPS_MIN) else 0.6
 
-    # Zitier-Dichte
+    # Zitier-Dichte  (Abbruch, sobald CITE_RATIO_THR sicher erreicht ist)
     lines = [l.strip() for l in txt.splitlines() if l.strip()]
-    cite_ratio = sum(_is_cite_line(l) for l in lines) / (len(lines) or 1)
+    need  = CITE_RATIO_THR * len(lines)
+    cites = 0
+    for _ in _RE_CITE_LINE.finditer("\n".join(lines)):
+        cites += 1
+        if cites >= need:
+            break
+    cite_ratio = cites / (len(lines) or 1)
 
     score = HDR_W * hdr_bonus + CITE_W * min(cite_ratio / CITE_RATIO_THR, 1.0)
     return max(score, MIN_SCORE_ABS) if cite_ratio >= 0.05 else score
@@ -141,36 +144,78 @@ async def _gpt_flag(txt: str, sem: asyncio.Semaphore) -> bool:
         )
     return r.choices[0].message.content.strip().upper().startswith("B")
 
+def _median(vals: Sequence[float]) -> float:
+    srt = sorted(vals)
+    mid = len(srt) // 2
+    return srt[mid] if len(srt) % 2 else (srt[mid-1] + srt[mid]) / 2
+
 def _choose_better(cur: Tuple[int, int] | None,
                    cand: Tuple[int, int],
-                   scores: Sequence[float]) -> Tuple[int, int]:
-    """Pick interval with higher mean-score (tie-break = longer)."""
+                   prefix: Sequence[float]) -> Tuple[int, int]:
+    """Pick interval with higher mean-score (tie-break = longer).
+    *prefix* = Präfixsummen der Scores (prefix[i] = sum(scores[:i]))."""
     if cur is None:
         return cand
-    cur_avg  = statistics.mean(scores[cur[0]:cur[1]+1])
-    cand_avg = statistics.mean(scores[cand[0]:cand[1]+1])
+    cur_avg  = (prefix[cur[1]+1] - prefix[cur[0]]) / (cur[1]-cur[0]+1)
+    cand_avg = (prefix[cand[1]+1] - prefix[cand[0]]) / (cand[1]-cand[0]+1)
     if cand_avg > cur_avg or (cand_avg == cur_avg and cand[1]-cand[0] > cur[1]-cur[0]):
         return cand
     return cur
 
 # ───────────────────────── Text-Puller (Head / Tail) ────────────────────────
-def _pull_pages(p: Path, head: float, tail: float) -> List[Tuple[int, str]]:
+# Ohne sort=True: die Heuristiken (DOI, Jahr, Autor) sind reihenfolge-unabhängig;
+# sortiert wird nur noch der Text der zurückgegebenen ersten Seite.
+def _head_tail(n: int, head: float, tail: float,
+               text: Callable[[int], str]) -> List[Tuple[int, str]]:
+    head_n   = math.ceil(n * head)
+    tail_n   = math.ceil(n * tail)
+    out: list[Tuple[int, str]] = []
+
+    # Kopf
+    for i in range(head_n):
+        out.append((i, text(i)))
+
+    # Schwanz
+    for i in range(n-1, max(-1, n-tail_n-1), -1):
+        out.append((i, text(i)))
+
+    dbg("pulled %d/%d pages (head=%d, tail=%d)", len(out), n, head_n, tail_n)
+    return out
+
+def _pull_pages(p: Path, head: float, tail: float,
+                pages_text: Sequence[str] | None = None) -> List[Tuple[int, str]]:
+    """Head/Tail-Seiten; mit *pages_text* ohne erneute Text-Extraktion."""
+    if pages_text is not None:
+        return _head_tail(len(pages_text), head, tail, pages_text.__getitem__)
     with fitz.open(p) as doc:
-        n        = doc.page_count
-        head_n   = math.ceil(n * head)
-        tail_n   = math.ceil(n * tail)
-        out: list[Tuple[int, str]] = []
+        return _head_tail(doc.page_count, head, tail,
+                          lambda i: doc.load_page(i).get_text("text"))
 
-        # Kopf
-        for i in range(head_n):
-            out.append((i, doc.load_page(i).get_text("text", sort=True)))
+_PAGE_CHUNK_MIN = 16          # min. Seiten pro Worker-Chunk (sonst lohnt kein Pool)
 
-        # Schwanz
-        for i in range(n-1, max(-1, n-tail_n-1), -1):
-            out.append((i, doc.load_page(i).get_text("text", sort=True)))
+def _extract_range(args: Tuple[str, int, int]) -> List[str]:
+    """Worker: Seiten [lo, hi) eines PDFs, Dokument einmal pro Chunk geöffnet."""
+    path, lo, hi = args
+    with fitz.open(path) as doc:
+        return [doc.load_page(i).get_text("text") for i in range(lo, hi)]
 
-        dbg("pulled %d/%d pages (head=%d, tail=%d)", len(out), n, head_n, tail_n)
-        return out
+def _page_texts(p: Path, workers: int = 1) -> List[str]:
+    """
+    Alle Seitentexte einmal extrahieren (für Keyword- und Heuristik-Stufe);
+    große PDFs seitenweise in Chunks auf *workers* Prozesse verteilt.
+    """
+    with fitz.open(p) as doc:
+        n = doc.page_count
+        if workers <= 1 or n < 2 * _PAGE_CHUNK_MIN:
+            return [pg.get_text("text") for pg in doc]
+    size = max(_PAGE_CHUNK_MIN, -(-n // workers))            # ceil
+    jobs = [(str(p), lo, min(n, lo + size)) for lo in range(0, n, size)]
+    # kein fork: detect_bibliography läuft auch in Threads des Web-Prozesses
+    ctx  = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=ctx) as pool:
+        return [txt for chunk in pool.map(_extract_range, jobs) for txt in chunk]
 
 # ───────────────────────── Kern-Detector (reiner Text) ──────────────────────
 def _detect_block(
@@ -180,18 +225,22 @@ def _detect_block(
     use_gpt  : bool  = False,
     gpt_only : bool  = False,
     boost    : float = 1.0,
+    fullscan : bool  = True,
+    pages_text: Sequence[str] | None = None,
 ) -> Tuple[Optional[Tuple[int, int]], Optional[str]]:
     """
     Liefert ((first,last), page_text_of_first)  oder  (None,None)
+    fullscan=False → kein Fallback auf das ganze PDF (nur Head/Tail).
+    pages_text     → bereits extrahierte Seitentexte wiederverwenden.
     """
 
     def _evaluate(pages: List[Tuple[int, str]]) -> Tuple[int, int] | None:
         # Seitenscoring parallel
-        scores = [0.0] * len(pages)
         with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4)) as tp:
-            for i, sc in enumerate(tp.map(lambda p: _score_page(p[1]), pages)):
-                scores[i] = sc
-        med = statistics.median(scores)
+            scores = list(tp.map(lambda p: _score_page(p[1]), pages))
+        if not scores:
+            return None
+        med = _median(scores)
         dbg("scores=%s  median=%.3f", scores, med)
 
         # GPT-Verfeinerung
@@ -201,7 +250,7 @@ def _detect_block(
             async def refine() -> None:
                 tasks = []
                 for i, (_, txt) in enumerate(pages):
-                    if gpt_only or scores[i] < 0.75:          # nur unsichere Seiten
+                    if gpt_only or scores[i] < SURE_SCORE:    # nur unsichere Seiten
                         tasks.append(asyncio.create_task(_gpt_flag(txt, sem)))
                     else:
                         tasks.append(asyncio.create_task(asyncio.sleep(0)))
@@ -215,15 +264,16 @@ def _detect_block(
                 LOG.warning("GPT-skip: %s", exc)
 
         # bestes zusammenhängendes Intervall
+        prefix = list(accumulate(scores, initial=0.0))
         best: Tuple[int, int] | None = None
         cur  : int  | None = None
         for idx, sc in enumerate(scores):
             if sc >= med * boost:
                 cur = idx if cur is None else cur
             elif cur is not None:
-                best = _choose_better(best, (cur, idx-1), scores); cur = None
+                best = _choose_better(best, (cur, idx-1), prefix); cur = None
         if cur is not None:
-            best = _choose_better(best, (cur, len(scores)-1), scores)
+            best = _choose_better(best, (cur, len(scores)-1), prefix)
 
         if best and (best[1]-best[0]+1) >= MIN_BLOCK_LEN:
             abs_pages = [pages[i][0]+1 for i in range(best[0], best[1]+1)]
@@ -234,19 +284,26 @@ def _detect_block(
     dbg("=== %s ===", pdf.name)
 
     # Schnell-Pfad: Head/Tail
-    res = _evaluate(_pull_pages(pdf, head, tail))
+    res = _evaluate(_pull_pages(pdf, head, tail, pages_text))
     if res:
         first_txt = fitz.open(pdf).load_page(res[0]-1).get_text("text", sort=True)
         LOG.debug("fast-path OK (%.2fs)", perf_counter()-t0)
         return res, first_txt
 
+    if not fullscan:
+        LOG.debug("fast miss, fullscan disabled (%.2fs)", perf_counter()-t0)
+        return (None, None)
+
     # Full-Scan
     dbg("fast miss → fullscan")
-    pages = [(i, pg.get_text("text", sort=True)) for i, pg in enumerate(fitz.open(pdf))]
+    if pages_text is None:
+        pages_text = _page_texts(pdf)
+    pages = list(enumerate(pages_text))
     res   = _evaluate(pages)
     if res:
+        first_txt = fitz.open(pdf).load_page(res[0]-1).get_text("text", sort=True)
         LOG.debug("fullscan OK (%.2fs)", perf_counter()-t0)
-        return res, pages[res[0]-1][1]
+        return res, first_txt
 
     LOG.debug("no match (%.2fs)", perf_counter()-t0)
     return (None, None)
@@ -274,8 +331,8 @@ def _bib_from_toc(lines: list[str]) -> int | None:
 
 _RE_BIB_HDR = re.compile(
     r"\b(bibliograph\w*|references?|reference\s+list|works\s+cited|"
-    r"literaturverzeichnis|quellen(?:verzeichnis| und literatur)?)\b", re.I
-)
+    r"literaturverzeichnis|quellen(?:verzeichnis| und literatur)?)\b"
+)                                            # ohne re.I → gegen .lower() matchen
 
 def detect_bibliography(                       # Public API
     pdf          : str | Path,
@@ -287,11 +344,12 @@ def detect_bibliography(                       # Public API
     tail         : float      = 0.25,
     use_gpt      : bool       = False,
     boost        : float      = 1.0,
+    toc_range    : bool       = False,
 ) -> Optional[Tuple[int, int]]:
     """
     Rückgabe (first_page, last_page)  oder  None.
     Pipeline:
-        0. ToC-Jackpot
+        0. ToC-Jackpot   (toc_range=True → Block ab ToC-Seite per Heuristik)
         1. Keyword-Block
         2. Heading-Fonts
         3. Vollheuristik (Text only)
@@ -302,12 +360,28 @@ def detect_bibliography(                       # Public API
 
     # 0) Inhaltsverzeichnis --------------------------------------------------
     toc_pg, toc_lines = _toc_scan(pdf_path, max_pages=None, use_ocr=False)
+    toc_barrier = toc_pg or 0
     if (bib := _bib_from_toc(toc_lines)):
         LOG.info("Bibliographie via ToC → Seite %d", bib)
-        return (bib, bib)                     # konservativ: 1-Seiten-Block
+        if not toc_range:
+            return (bib, bib)                 # konservativ: 1-Seiten-Block
+
+        # Keyword- & Font-Stufe überspringen, nur [bib-1, EOF] heuristisch
+        with fitz.open(pdf_path) as doc:
+            n = doc.page_count
+        block, _ = _detect_block(
+            pdf_path, head=0.0, tail=min(1.0, (n - bib + 2) / n),
+            boost=boost, use_gpt=use_gpt, gpt_only=False, fullscan=False)
+        if block and block[0] <= bib <= block[1]:
+            return block
+        return (bib, bib)
+
+    # Seitentext einmal ziehen → Keyword-Stufe & Heuristik teilen ihn
+    pages_text = _page_texts(pdf_path, workers=kw_workers)
 
     # 1) Keyword-Hits --------------------------------------------------------
-    kw_pages: List[int] = _kw_pages(pdf_path, workers=kw_workers, debug=False)
+    kw_pages: List[int] = _kw_pages(pdf_path, workers=kw_workers, debug=False,
+                                    pages_text=pages_text)
     kw_pages.sort()
     if kw_pages:
         runs, cur = [], [kw_pages[0]]
@@ -317,13 +391,14 @@ def detect_bibliography(                       # Public API
             else:
                 runs.append(cur); cur = [p]
         runs.append(cur)
+        # Läufe auf/vor der ToC-Seite sind das Inhaltsverzeichnis selbst
+        runs = [r for r in runs if r[0] > toc_barrier] or [[]]
         best_run = max(runs, key=len)
         if len(best_run) >= kw_min_block:
             LOG.info("Bibliographie via Keyword-Block %s", best_run)
             return best_run[0], best_run[-1]
 
     # 2) Heading-Fonts -------------------------------------------------------
-    toc_barrier = toc_pg or 0
     fonts       = _font_scan(pdf_path, threads=font_threads)
 
     meta_dir  = Path("meta") / pdf_path.stem
@@ -334,13 +409,14 @@ def detect_bibliography(                       # Public API
     _, chaps, _ = _chap_analyse(str(json_path), trace=False)
     if chaps:
         bib_hdrs = [h for h in chaps.get("chapters", [])
-                    if _RE_BIB_HDR.search(h["text"]) and h["page"] > toc_barrier]
+                    if _RE_BIB_HDR.search(h["text"].lower()) and h["page"] > toc_barrier]
         if bib_hdrs:
             first = min(h["page"] for h in bib_hdrs)
             LOG.info("Bibliographie via Heading-Fonts → Seite %d", first)
             block, _ = _detect_block(
                 pdf_path, head=0.0, tail=0.0,
-                boost=boost, use_gpt=use_gpt, gpt_only=False)
+                boost=boost, use_gpt=use_gpt, gpt_only=False,
+                pages_text=pages_text)
             if block and block[0] <= first <= block[1]:
                 return block
             return (first, first)
@@ -348,7 +424,8 @@ def detect_bibliography(                       # Public API
     # 3) Vollheuristik -------------------------------------------------------
     bounds, _ = _detect_block(
         pdf_path, head=head, tail=tail,
-        boost=boost, use_gpt=use_gpt, gpt_only=False)
+        boost=boost, use_gpt=use_gpt, gpt_only=False,
+        pages_text=pages_text)
     if bounds:
         LOG.info("Bibliographie via detect() → %s", bounds)
     return bounds
@@ -374,6 +451,8 @@ def main() -> None:
     ap.add_argument("--tail", type=float, default=0.25)
     ap.add_argument("--gpt", action="store_true")
     ap.add_argument("--boost", type=float, default=1.0)
+    ap.add_argument("--toc-range", action="store_true",
+                    help="ToC-Treffer als Seitenblock statt Einzelseite")
     ap.add_argument("-j", type=int, default=os.cpu_count() or 4, help="Prozesse")
     ap.add_argument("--debug", action="store_true")
     args = ap.parse_args()
@@ -383,7 +462,7 @@ def main() -> None:
     if args.path.is_file():
         res = detect_bibliography(
             args.path, head=args.head, tail=args.tail,
-            use_gpt=args.gpt, boost=args.boost)
+            use_gpt=args.gpt, boost=args.boost, toc_range=args.toc_range)
         print(json.dumps({args.path.name: res}, indent=2, ensure_ascii=False))
         return
 
@@ -394,7 +473,7 @@ def main() -> None:
         res = _batch(
             pdfs, workers=args.j,
             head=args.head, tail=args.tail,
-            use_gpt=args.gpt, boost=args.boost)
+            use_gpt=args.gpt, boost=args.boost, toc_range=args.toc_range)
         print(json.dumps(res, indent=2, ensure_ascii=False))
         return
 
@@ -6,7 +6,7 @@
 from __future__ import annotations
 import argparse, concurrent.futures as cf, json, logging, os, re, sys, time
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Sequence, Tuple
 
 import fitz                    # PyMuPDF
 from tqdm import tqdm
@@ -53,32 +53,34 @@ _TERMS = [
 "Referanser","Litteraturliste","Kildeliste","Bibliografi","Litteratur","Kilder","Referanseliste",
 "Referencer","Referenser","Litteraturförteckning",
 ]
-# ─── Statt _TERMS = [...]  folgendes einfügen ────────────────────────────
-import csv
-_TERMS_CSV = Path(__file__).with_name("bibliography_terms.csv")
-if not _TERMS_CSV.exists():
-    sys.exit("bibliography_terms.csv fehlt neben dem Skript!")
+# ─── Statt _TERMS = [...]  gemeinsame Terme/Regex aus _terms.py ─────────
+# Lazy: CSV lesen + kompilieren erst beim ersten Seiten-Check, nicht beim Import
+from services.delb._terms import TERMS_CSV as _TERMS_CSV, bib_regex, bib_terms
 
-with _TERMS_CSV.open(newline="", encoding="utf-8") as fh:
-    reader = csv.DictReader(fh)
-    TERMS  = [row["term"].strip() for row in reader if row.get("term")]
-if not TERMS:
-    sys.exit("bibliography_terms.csv leer oder Spaltenname ≠ 'term'")
-
-_TERM_RE = re.compile(r"\b(" + "|".join(map(re.escape, TERMS)) + r")\b", re.I)
 # ──────────────── Seitentext lesen (ein Prozess) ────────────────────────────
 def check_page(args: Tuple[str,int]) -> Tuple[int,bool,str]:
     """Liest *eine* Seite, meldet (index, Treffer?, erstes gef. Wort)"""
     pdf_path, page_idx = args
     with fitz.open(pdf_path) as doc:
-        txt = doc.load_page(page_idx).get_text("text", sort=True)
-    m = _TERM_RE.search(txt)
+        txt = doc.load_page(page_idx).get_text("text")   # Reihenfolge egal
+    m = bib_regex().search(txt.lower())
     return page_idx, bool(m), (m.group(0) if m else "")
 
 # ──────────────── Analyse pro PDF ───────────────────────────────────────────
-def analyse_pdf(pdf: Path, *, workers:int, debug:bool) -> List[int]:
+def analyse_pdf(pdf: Path, *, workers:int, debug:bool,
+                pages_text: Sequence[str] | None = None) -> List[int]:
+    """1-basierte Trefferseiten; *pages_text* → kein erneutes Öffnen/Extrahieren."""
     dbg("Start %s", pdf.name)
     t0 = time.perf_counter()
+    if pages_text is not None:
+        pages_hit = []
+        for idx, txt in enumerate(pages_text):
+            if (m := bib_regex().search(txt.lower())):
+                pages_hit.append(idx+1)
+                dbg(" %s  p.%d  ->  «%s»", pdf.name, idx+1, m.group(0))
+        LOG.info("✓ %s  →  %s  (%.2fs)", pdf.name, pages_hit,
+                 time.perf_counter()-t0)
+        return pages_hit
     with fitz.open(pdf) as doc:
         idxs = list(range(doc.page_count))
     pages_hit: List[int] = []
@@ -113,6 +115,11 @@ def main():
 
     init_log(args.debug)
 
+    if not _TERMS_CSV.exists():
+        sys.exit("bibliography_terms.csv fehlt neben dem Skript!")
+    if not bib_terms():
+        sys.exit("bibliography_terms.csv leer oder Spaltenname ≠ 'term'")
+
     if args.path.is_file():
         pages = analyse_pdf(args.path, workers=args.jobs, debug=args.debug)
         print(json.dumps({args.path.name: pages}, indent=2, ensure_ascii=False))
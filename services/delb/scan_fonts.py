@@ -18,7 +18,7 @@ Aufruf­beispiele
 """
 from __future__ import annotations
 
-import argparse, json, logging, math, os, sys, time
+import argparse, json, logging, math, os, sys, threading, time
 from concurrent import futures as cf
 from pathlib import Path
 from typing import Dict, Tuple, List
@@ -28,12 +28,44 @@ from tqdm import tqdm
 
 LOG = logging.getLogger("fontrec")
 
+# MuPDF-Warnungen kaputter PDFs nicht pro Seite auf stderr formatieren
+fitz.TOOLS.mupdf_display_errors(False)
+logging.getLogger("fitz").setLevel(logging.ERROR)
+
 # --------------------------------------------------------------------------- #
 FontKey = Tuple[str, float, int]  # (FontName, Size, StyleFlags)
 
+# Pro Span kein (str, float, int)-Tupel mehr, sondern ein gepackter int:
+#   (font_id << 32) | (size*10 << 16) | flags
+# Fontnamen werden prozessweit auf kleine IDs interniert.
+_FONT_IDS: Dict[str, int] = {}
+_FONT_NAMES: List[str] = []
+_FONT_LOCK = threading.Lock()
+
+
+def _font_id(name: str) -> int:
+    fid = _FONT_IDS.get(name)
+    if fid is None:
+        with _FONT_LOCK:                       # ThreadPool → nur beim Miss sperren
+            fid = _FONT_IDS.setdefault(name, len(_FONT_NAMES))
+            if fid == len(_FONT_NAMES):
+                _FONT_NAMES.append(name)
+    return fid
+
+
+def span_key(span) -> int:
+    size10 = round(span["size"] * 10) & 0xFFFF
+    return (_font_id(span["font"]) << 32) | (size10 << 16) | (span["flags"] & 0xFFFF)
+
+
+def unpack_key(key: int) -> FontKey:
+    """Gepackten Span-Key → (FontName, Size, StyleFlags)."""
+    return _FONT_NAMES[key >> 32], ((key >> 16) & 0xFFFF) / 10, key & 0xFFFF
+
 
-def span_key(span) -> FontKey:
-    return span["font"], round(span["size"], 1), span["flags"]
+def _ranking(stats: Dict[int, int]) -> List[list]:
+    return [list(k) + [c] for k, c in sorted(((unpack_key(k), c) for k, c in stats.items()),
+                                              key=lambda t: (-t[1], t[0]))]
 
 
 def analyse_page(idx_page_tuple):
@@ -41,7 +73,7 @@ def analyse_page(idx_page_tuple):
     i, pdf_path = idx_page_tuple
     doc = fitz.open(pdf_path)
     page = doc.load_page(i)
-    stats: Dict[FontKey, int] = {}
+    stats: Dict[int, int] = {}
     for block in page.get_text("dict")["blocks"]:
         if block["type"]:
             continue
@@ -60,7 +92,7 @@ def analyse_pdf(pdf_path: Path, threads: int) -> dict:
     t0 = time.perf_counter()
     doc = fitz.open(pdf_path)
     n_pages = doc.page_count
-    global_stats: Dict[FontKey, int] = {}
+    global_stats: Dict[int, int] = {}
     pages_out: List[dict] = [{}] * n_pages  # pre‑alloc
 
     with cf.ThreadPoolExecutor(max_workers=threads) as tp:
@@ -68,8 +100,7 @@ def analyse_pdf(pdf_path: Path, threads: int) -> dict:
                              total=n_pages, desc=pdf_path.name, leave=False):
             pages_out[i] = {
                 "page": i + 1,
-                "fonts": [list(k) + [c] for k, c in sorted(stats.items(),
-                                                             key=lambda t: (-t[1], t[0]))],
+                "fonts": _ranking(stats),
             }
             for k, c in stats.items():
                 global_stats[k] = global_stats.get(k, 0) + c
@@ -78,8 +109,7 @@ def analyse_pdf(pdf_path: Path, threads: int) -> dict:
         "pdf": pdf_path.name,
         "pages_total": n_pages,
         "runtime_s": round(time.perf_counter() - t0, 3),
-        "font_ranking": [list(k) + [c] for k, c in sorted(global_stats.items(),
-                                                           key=lambda t: (-t[1], t[0]))],
+        "font_ranking": _ranking(global_stats),
         "pages": pages_out,
     }
 
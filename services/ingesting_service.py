@@ -14,9 +14,10 @@ import logging
 import os
 import re
 import unicodedata
+from collections        import defaultdict, deque
 from concurrent.futures import ThreadPoolExecutor
 from pathlib            import Path
-from typing             import Optional, Tuple
+from typing             import Dict, List, Optional, Sequence, Tuple
 
 import mysql.connector as mysql
 from dotenv             import load_dotenv
@@ -32,13 +33,24 @@ LOG.setLevel(os.getenv("INGEST_LOG", "INFO").upper())
 
 _POOL: mysql.pooling.MySQLConnectionPool | None = None
 _BG_POOL = ThreadPoolExecutor(max_workers=4)          # async Ref-Parsing
+_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "500"))  # Zeilen pro Multi-Row-INSERT
+_TOC_RANGE  = os.getenv("TOC_RANGE", "0") == "1"            # ToC-Block statt Einzelseite
 
 # ───────────── Utility-Funktionen ───────────────────────────────────────────
 YEAR_RE = re.compile(r"(19|20)\d{2}")
+_WS_RE  = re.compile(r"\s+")
+# Dateiname → bis zu 4 Teile an den ersten 3 Trennern " - ", " _", " (", ")"
+# (identisch zu re.split(..., maxsplit=3), aber ein einziger match())
+_FNAME_SEP = r"(?: - | _| \(|\))"
+_FNAME_RE  = re.compile(
+    rf"^(?P<p1>.*?)(?:{_FNAME_SEP}(?P<p2>.*?)"
+    rf"(?:{_FNAME_SEP}(?P<p3>.*?)(?:{_FNAME_SEP}(?P<p4>.*))?)?)?$", re.S)
 
 def _norm(s: str) -> str:
-    return re.sub(r"\s+", " ",
-                  unicodedata.normalize("NFKD", s).lower()).strip()
+    # ASCII (O(1)) bzw. Quick-Check „schon NFKD“ → keine Dekomposition nötig
+    if not s.isascii() and not unicodedata.is_normalized("NFKD", s):
+        s = unicodedata.normalize("NFKD", s)
+    return _WS_RE.sub(" ", s.lower()).strip()
 
 def _hash_work(title: str, authors: str,
                publisher: str, year: Optional[int]) -> str:
@@ -63,8 +75,7 @@ def _meta_from_fname(fname: str) -> Tuple[str, str, str, Optional[int]]:
         year = int(m.group())
 
     # very naive split heuristics
-    parts = re.split(r" - | _| \(|\)", stem, maxsplit=3)
-    parts = [p.strip(" _-") for p in parts if p.strip(" _-")]
+    parts = [p for p in (g.strip(" _-") for g in _FNAME_RE.match(stem).groups() if g) if p]
 
     author = title = ""
     if len(parts) == 1:
@@ -76,19 +87,44 @@ def _meta_from_fname(fname: str) -> Tuple[str, str, str, Optional[int]]:
 
     return title, author, publ, year
 
+Meta = Tuple[str, str, str, Optional[int]]
+
+def _meta_and_hash_batch(fnames: Sequence[str]) -> List[Tuple[str, Meta]]:
+    """
+    (hash, meta) für alle Dateinamen eines Batches in einem Durchlauf –
+    gleiche Dateinamen werden nur einmal zerlegt und gehasht.
+    """
+    done: Dict[str, Tuple[str, Meta]] = {}
+    for name in dict.fromkeys(fnames):
+        meta = _meta_from_fname(name)
+        done[name] = (_hash_work(*meta), meta)
+    return [done[name] for name in fnames]
+
 # ───────────── Lazy-Pool-Factory ────────────────────────────────────────────
+def _pool_size() -> int:
+    """≥ Web-Worker, damit kein Upload-Thread auf eine Verbindung wartet
+    (mysql.connector erlaubt max. 32 pro Pool)."""
+    workers = int(os.getenv("WEB_WORKERS", os.cpu_count() or 4))
+    return min(32, max(int(os.getenv("DB_POOL_SIZE", "16")), workers))
+
 def _get_pool() -> mysql.pooling.MySQLConnectionPool:
     global _POOL
     if _POOL is None:
         _POOL = mysql.pooling.MySQLConnectionPool(
             pool_name   = "bibbud_pool",
-            pool_size   = int(os.getenv("DB_POOL_SIZE", "10")),
+            pool_size   = _pool_size(),
             host        = os.getenv("DB_HOST"),
             user        = os.getenv("DB_USER"),
             password    = os.getenv("DB_PASSWORD"),
             database    = os.getenv("DB_NAME", "Bibbud"),
             charset     = "utf8mb4",
-            autocommit  = False,
+            autocommit  = False,              # ingest_single/-batch = Transaktion
+            use_pure    = False,              # C-Extension statt Pure-Python
+            compress    = True,               # Batch-INSERTs → weniger Bytes
+            consume_results    = True,
+            buffered           = True,
+            sql_mode           = "STRICT_ALL_TABLES",
+            connection_timeout = 5,           # fail fast statt hängen
         )
     return _POOL
 
@@ -106,20 +142,24 @@ def ingest_single(
     """
 
     # 1 · Bibliographie-Seiten finden ---------------------------------------
-    bounds = detect_bibliography(pdf_path, tail=tail_ratio)
+    bounds = detect_bibliography(pdf_path, tail=tail_ratio, toc_range=_TOC_RANGE)
 
     # 2 · Metadaten + Hash ---------------------------------------------------
     title, authors, publisher, year = _meta_from_fname(pdf_path.name)
     w_hash = _hash_work(title, authors, publisher, year)
 
-    # 3 · Transaktion --------------------------------------------------------
-    with _get_pool().get_connection() as cnx, cnx.cursor() as cur:
+    # 3 · Transaktion  (prepared → Statements pro Verbindung nur 1× geparst) --
+    # buffered=False explizit: der Pool puffert per Default, und mysql.connector
+    # kennt keinen Cursor, der zugleich buffered *und* prepared ist
+    with _get_pool().get_connection() as cnx, \
+         cnx.cursor(prepared=True, buffered=False) as cur:
         try:
-            # works (analysed = 1 bei eigenem PDF)
-            cur.execute("SELECT id FROM works WHERE hash=%s", (w_hash,))
-            row = cur.fetchone()
-            if row:
-                wid = row[0]
+            # works (analysed = 1 bei eigenem PDF) – Lookup statt Upsert, da
+            # works.hash keinen UNIQUE-Index hat (wie ingest_batch/bib_handler)
+            cur.execute("SELECT id FROM works WHERE hash=%s ORDER BY id", (w_hash,))
+            rows = cur.fetchall()               # unbuffered: Ergebnis ganz lesen
+            if rows:
+                wid = rows[0][0]
                 cur.execute("UPDATE works SET analysed=1 WHERE id=%s", (wid,))
             else:
                 cur.execute("""
@@ -155,4 +195,129 @@ def ingest_single(
         else:
             process_document(did)
 
-    return pdf_path.name, bounds
\ No newline at end of file
+    return pdf_path.name, bounds
+
+
+# ───────────── Batch-API ────────────────────────────────────────────────────
+def _detect_safe(pdf_path: Path, tail_ratio: float):
+    try:
+        bounds = detect_bibliography(pdf_path, tail=tail_ratio, toc_range=_TOC_RANGE)
+        return pdf_path, bounds, None
+    except Exception as exc:           # einzelnes PDF darf den Batch nicht kippen
+        LOG.exception("Analyse fehlgeschlagen: %s", pdf_path.name)
+        return pdf_path, None, exc
+
+def _chunks(seq: Sequence, n: int):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+def _marks(n: int) -> str:
+    return ",".join(["%s"] * n)
+
+def _work_ids(cur, hashes: Sequence[str]) -> Dict[str, int]:
+    """hash → id (bei Altlast-Duplikaten die älteste Zeile, wie fetchone)."""
+    if not hashes:
+        return {}
+    cur.execute(f"SELECT id, hash FROM works WHERE hash IN ({_marks(len(hashes))}) "
+                "ORDER BY id DESC", list(hashes))
+    return {h: wid for wid, h in cur.fetchall()}
+
+def ingest_batch(
+    pdf_paths  : Sequence[Path],
+    *,
+    tail_ratio : float      = 0.25,
+    parse_refs : bool       = True,
+    async_refs : bool       = False,
+    workers    : int | None = None,
+) -> List[Tuple[str, Tuple[int, int] | None]]:
+    """
+    Wie ingest_single(), aber für viele PDFs mit *einer* Transaktion:
+        works              → SELECT … WHERE hash IN (…), UPDATE der Treffer,
+                             executemany-INSERT der neuen Hashes, IDs nachlesen
+                             (kein UNIQUE-Index auf works.hash nötig)
+        documents          → Multi-Row-INSERT, IDs per SELECT … id >= lastrowid
+                             (auch bei auto_increment_increment ≠ 1)
+        bibliography_pages → Multi-Row-INSERT
+    Statt 3-4 Round-Trips pro Datei nur ~6 pro Batch-Chunk.
+    Fehlgeschlagene Erkennung → (Dateiname, None), ohne DB-Eintrag.
+    """
+    if not pdf_paths:
+        return []
+
+    # 1 · Bibliographie-Seiten parallel finden ------------------------------
+    with ThreadPoolExecutor(max_workers=workers or min(len(pdf_paths), 4)) as tp:
+        detected = list(tp.map(lambda p: _detect_safe(p, tail_ratio), pdf_paths))
+
+    results: List[Tuple[str, Tuple[int, int] | None]] = [
+        (p.name, bounds) for p, bounds, _ in detected]
+    ok = [(p, bounds) for p, bounds, exc in detected if exc is None]
+    if not ok:
+        return results
+
+    # 2 · Metadaten + Hash ---------------------------------------------------
+    rows = [(p, bounds, h, meta)
+            for (p, bounds), (h, meta)
+            in zip(ok, _meta_and_hash_batch([p.name for p, _ in ok]))]
+
+    # 3 · Transaktion --------------------------------------------------------
+    bib_docs: List[int] = []
+    with _get_pool().get_connection() as cnx, cnx.cursor() as cur:
+        try:
+            for chunk in _chunks(rows, _BATCH_ROWS):
+                # works (analysed = 1 bei eigenem PDF) – Lookup statt Upsert
+                hashes = list(dict.fromkeys(h for _, _, h, _ in chunk))
+                wid_of = _work_ids(cur, hashes)
+                if wid_of:
+                    cur.execute(
+                        f"UPDATE works SET analysed=1 WHERE id IN ({_marks(len(wid_of))})",
+                        list(wid_of.values()))
+                new = {h: meta for _, _, h, meta in chunk if h not in wid_of}
+                if new:
+                    cur.executemany("""
+                        INSERT INTO works (hash,title,authors,publisher,year,analysed)
+                        VALUES (%s,%s,%s,%s,%s,1)
+                    """, [(h, *meta) for h, meta in new.items()])
+                    wid_of.update(_work_ids(cur, list(new)))
+
+                # documents – Multi-Row-INSERT; IDs werden nachgelesen statt
+                # lastrowid + i anzunehmen (Galera/Group-Replication: Schrittweite ≠ 1)
+                cur.execute(
+                    "INSERT INTO documents (work_id,filename,filepath,filesize) VALUES "
+                    + ",".join(["(%s,%s,%s,%s)"] * len(chunk)),
+                    [v for p, _, h, _ in chunk
+                       for v in (wid_of[h], p.name, str(p), p.stat().st_size)])
+                paths = list(dict.fromkeys(str(p) for p, _, _, _ in chunk))
+                cur.execute(
+                    f"SELECT id, filepath FROM documents WHERE id >= %s "
+                    f"AND filepath IN ({_marks(len(paths))}) ORDER BY id",
+                    [cur.lastrowid, *paths])
+                ids_of: Dict[str, deque] = defaultdict(deque)
+                for did, fp in cur.fetchall():
+                    ids_of[fp].append(did)
+                dids = [ids_of[str(p)].popleft() for p, _, _, _ in chunk]
+
+                # bibliography_pages
+                bib = [(did, *bounds)
+                       for did, (_, bounds, _, _) in zip(dids, chunk) if bounds]
+                if bib:
+                    cur.execute(
+                        "INSERT INTO bibliography_pages (document_id,start_page,end_page) VALUES "
+                        + ",".join(["(%s,%s,%s)"] * len(bib)),
+                        [v for row in bib for v in row])
+                    bib_docs.extend(did for did, _, _ in bib)
+            cnx.commit()
+
+        except Exception as exc:
+            cnx.rollback()
+            LOG.error("Batch-Ingest failed (%d PDFs) – %s", len(rows), exc)
+            raise
+
+    # 4 · Referenz-Extraktion -----------------------------------------------
+    if parse_refs and os.getenv("PARSE_REFS", "1") != "0":
+        for did in bib_docs:
+            if async_refs:
+                _BG_POOL.submit(process_document, did)
+            else:
+                process_document(did)
+
+    return results
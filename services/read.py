@@ -22,6 +22,7 @@ import os
 import re
 import sys
 import unicodedata
+from functools import lru_cache
 from typing import Optional
 
 import mysql.connector as mysql
@@ -67,10 +68,17 @@ def _get_pool() -> mysql.pooling.MySQLConnectionPool:
 
 # ---------------------------------------------------------------------------
 # Helper-Funktionen ----------------------------------------------------------
+_WS_RE = re.compile(r"\s+")
+
+@lru_cache(maxsize=8192)
 def _norm(s: str) -> str:
     """Lower-case + Unicode-NFD + Whitespace squash."""
-    return re.sub(r"\s+", " ", unicodedata.normalize("NFKD", s).lower()).strip()
+    # ASCII (O(1)) bzw. Quick-Check „schon NFKD“ → keine Dekomposition nötig
+    if not s.isascii() and not unicodedata.is_normalized("NFKD", s):
+        s = unicodedata.normalize("NFKD", s)
+    return _WS_RE.sub(" ", s.lower()).strip()
 
+@lru_cache(maxsize=1024)
 def work_hash(title: str, authors: str, year: Optional[int]) -> str:
     raw = f"{_norm(title)}|{_norm(authors)}|{year or ''}"
     return hashlib.sha1(raw.encode()).hexdigest()
@@ -89,38 +97,41 @@ def get_stats(title: str,
     _dbg("⟹ calculated hash: %s", h)
 
     cnx = _get_pool().get_connection()
-    cur = cnx.cursor(dictionary=True)
+    # prepared → Binär-Protokoll, Statements pro Verbindung nur 1× geparst
+    # (kein dictionary=True: mit prepared nicht in allen Connector-Versionen)
+    cur = cnx.cursor(prepared=True)
+
+    def _rows() -> list[dict]:
+        return [dict(zip(cur.column_names, r)) for r in cur.fetchall()]
 
     try:
-        # ---- 1) Werk -------------------------------------------------------
-        _dbg("• SELECT work by hash")
-        cur.execute("SELECT id, title, authors, year FROM works WHERE hash=%s", (h,))
-        work = cur.fetchone()
+        # ---- Werk + Upload-Zähler + Bibliographie-Seiten in *einem* Query ----
+        _dbg("• SELECT work/uploads/bib_pages by hash")
+        cur.execute(
+            """
+            SELECT w.id, w.title, w.authors, w.year,
+                   COUNT(DISTINCT d.id) AS uploads,
+                   JSON_ARRAYAGG(JSON_OBJECT('start_page', bp.start_page,
+                                             'end_page',   bp.end_page)) AS bib_pages
+              FROM works w
+              LEFT JOIN documents d           ON d.work_id = w.id
+              LEFT JOIN bibliography_pages bp ON bp.document_id = d.id
+             WHERE w.hash = %s
+             GROUP BY w.id
+            """, (h,))
+        work = next(iter(_rows()), None)
         _dbg("  ↳ result: %s", work)
         if not work:
             return None
 
-        wid = work["id"]
+        raw = work.pop("bib_pages") or "[]"
+        if isinstance(raw, (bytes, bytearray)):           # Binär-Protokoll
+            raw = raw.decode()
+        # LEFT JOIN ohne Treffer → [{start_page: null, end_page: null}]
+        pages = [p for p in json.loads(raw) if p["start_page"] is not None]
+        _dbg("  ↳ uploads=%s  pages=%s", work["uploads"], pages)
 
-        # ---- 2) Upload-Zähler ---------------------------------------------
-        _dbg("• COUNT uploads for work_id=%s", wid)
-        cur.execute("SELECT COUNT(*) AS uploads FROM documents WHERE work_id=%s", (wid,))
-        uploads = cur.fetchone()["uploads"]
-        _dbg("  ↳ uploads=%s", uploads)
-
-        # ---- 3) Bibliographie-Seiten --------------------------------------
-        _dbg("• SELECT bibliography_pages for work_id=%s", wid)
-        cur.execute(
-            """
-            SELECT start_page, end_page
-              FROM bibliography_pages
-              JOIN documents ON documents.id = bibliography_pages.document_id
-             WHERE documents.work_id = %s
-            """, (wid,))
-        pages = cur.fetchall()
-        _dbg("  ↳ pages=%s", pages)
-
-        return {**work, "uploads": uploads, "bib_pages": pages}
+        return {**work, "bib_pages": pages}
 
     finally:
         cur.close()
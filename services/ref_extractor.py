@@ -18,15 +18,21 @@ extract_references(pdf_path, pages,
 from __future__ import annotations
 
 import asyncio
+import atexit
 import logging
+import multiprocessing
 import os
 import re
+import threading
 import time
 import unicodedata
-from concurrent.futures import ThreadPoolExecutor
-from hashlib            import sha1
+from collections        import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools          import lru_cache
+from itertools          import chain
+from hashlib            import blake2b
 from pathlib            import Path
-from typing             import Callable, Dict, List, Optional
+from typing             import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
 import fitz                                 # PyMuPDF
 # ───────────────────────── GPT optional ─────────────────────────────────────
@@ -37,10 +43,17 @@ except ModuleNotFoundError:                  # pragma: no cover
 
 # ───────────────────────── Logging ──────────────────────────────────────────
 LOG = logging.getLogger("ref_extractor")
+_REF_DEBUG = os.getenv("REF_DEBUG") == "1"     # einmal beim Import lesen
 
 # ───────────────────────── Regex-Grundlagen ─────────────────────────────────
-YEAR_RE   = re.compile(r"(1[5-9]\d{2}|20\d{2})")
+YEAR_RE   = re.compile(r"(1[5-9]\d{2}|20\d{2})", re.A)
 _SHY      = "\u00AD"                         # Soft-Hyphen
+_WS_RE    = re.compile(r"\s+")
+# weicher Umbruch: Zeile endet nicht auf . ; : , und Folgezeile beginnt klein
+# (Kleinschreibung prüft _soft_join per str.islower → auch ż, ł, š, ő, …)
+_SOFT_BREAK_RE = re.compile(r"(?<=[^.;:,\s])[^\S\n]*\n(?=\S)")
+# alle str.splitlines()-Grenzen → "\n", damit der Regex dieselben Zeilen sieht
+_LINE_BREAKS = str.maketrans(dict.fromkeys("\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029", "\n"))
 
 _PATTERNS: dict[str, re.Pattern[str]] = {
     # APA-Style
@@ -60,36 +73,88 @@ _PATTERNS: dict[str, re.Pattern[str]] = {
         r"^(?P<authors>.+?),\s+(?P<title>.+?),\s*(?P<publisher>[^0-9]+?)\s*(?P<year>\d{4})", re.U),
 }
 
+# Alle Stile als *eine* Alternation: Branch-Gruppe = Stil, Untergruppen mit
+# Präfix (Gruppennamen müssen eindeutig sein).  Reihenfolge = _PATTERNS-Priorität.
+_STYLE_KEYS = {name: re.sub(r"\W", "_", name) for name in _PATTERNS}
+_KEY_STYLE  = {key: name for name, key in _STYLE_KEYS.items()}
+_COMBINED   = re.compile(
+    "|".join(f"(?P<{key}>" + re.sub(r"\(\?P<(\w+)>", rf"(?P<{key}__\1>", _PATTERNS[name].pattern) + ")"
+             for name, key in _STYLE_KEYS.items()),
+    re.U)
+_STYLE_RANK = {name: i for i, name in enumerate(_PATTERNS)}
+
+def _detect_style(lines: List[str]) -> str:
+    """Erster Stil (in _PATTERNS-Reihenfolge), der irgendeine Zeile matcht."""
+    hits = [_KEY_STYLE[m.lastgroup] for l in lines if (m := _COMBINED.match(l))]
+    return min(hits, key=_STYLE_RANK.__getitem__, default="unknown")
+
 # ───────────────────────── Hilfsfunktionen ─────────────────────────────────
+@lru_cache(maxsize=8192)                     # Autoren/Verlage wiederholen sich
 def _norm(txt: Optional[str]) -> str:
     """Unicode-NFKD → Klein → Whitespace squash  (Null-safe)."""
     if not txt:
         return ""
-    txt = txt.replace(_SHY, "")
-    txt = unicodedata.normalize("NFKD", txt)
-    return re.sub(r"\s+", " ", txt).strip()
+    if not txt.isascii():             # NFKD/Soft-Hyphen betreffen nur Nicht-ASCII
+        txt = txt.replace(_SHY, "")
+        if not unicodedata.is_normalized("NFKD", txt):    # Quick-Check
+            txt = unicodedata.normalize("NFKD", txt)
+    return _WS_RE.sub(" ", txt).strip()
+
+def _soft_join(m: re.Match[str]) -> str:
+    return " " if m.string[m.end()].islower() else m.group()
 
 def _merge_lines(page_text: str) -> List[str]:
     """
     verbindet *weiche* Umbrüche; z. B. wenn eine Zeile nicht auf
     . ; : , endet und die Folgezeile mit Kleinbuchstaben startet.
     """
-    out, buf = [], ""
-    for ln in page_text.splitlines():
-        ln = ln.rstrip()
-        if not ln:
-            if buf:
-                out.append(buf); buf = ""
-            continue
-        if buf and not re.search(r"[.;:,]$", buf) and ln and ln[0].islower():
-            buf += " " + ln
-        else:
-            if buf:
-                out.append(buf)
-            buf = ln
-    if buf:
-        out.append(buf)
-    return out
+    page_text = page_text.replace("\r\n", "\n").translate(_LINE_BREAKS)
+    merged = _SOFT_BREAK_RE.sub(_soft_join, page_text)   # ein Regex-Durchlauf / Seite
+    return [ln for ln in map(str.rstrip, merged.splitlines()) if ln]
+
+# ───────────────────────── Seiten-Text (Prozess-Pool) ──────────────────────
+# PDF-Parsing ist CPU-lastig; ein prozessweiter Pool (lazy, geteilt von allen
+# ingest-Threads) verteilt große Bibliographien auf alle Kerne.
+_PAGE_POOL: ProcessPoolExecutor | None = None
+_PAGE_POOL_LOCK = threading.Lock()      # ingest-Threads dürfen nur *einen* Pool bauen
+_POOL_WORKERS   = os.cpu_count() or 4
+_POOL_MIN_PAGES = int(os.getenv("REF_POOL_MIN_PAGES", "8"))   # darunter seriell
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    global _PAGE_POOL
+    if _PAGE_POOL is None:
+        with _PAGE_POOL_LOCK:
+            if _PAGE_POOL is None:          # double-checked: Lock nur beim Anlegen
+                # forkserver statt fork: der Pool entsteht lazy in einem Thread des
+                # Flask-Prozesses – geforkte Kinder könnten fremde Locks (Logging,
+                # MySQL-Pool) im gesperrten Zustand erben
+                pool = ProcessPoolExecutor(
+                    max_workers=_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context(
+                        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                        else "spawn"))
+                atexit.register(pool.shutdown, cancel_futures=True)
+                _PAGE_POOL = pool
+    return _PAGE_POOL
+
+def _extract_chunk(args: Tuple[str, Sequence[int]]) -> List[str]:
+    """Worker: öffnet das PDF einmal pro Chunk und liefert die Seitentexte."""
+    pdf_path, idxs = args
+    with fitz.open(pdf_path, filetype="pdf") as doc:
+        return [doc.get_page_text(i, "text", sort=True) for i in idxs]
+
+def _iter_page_texts(pdf_path: Path, pages: Sequence[int]) -> Iterator[str]:
+    """Seitentexte in Reihenfolge; seriell Seite für Seite, sonst Chunk für Chunk."""
+    pages = list(pages)
+    if len(pages) < _POOL_MIN_PAGES:
+        with fitz.open(pdf_path, filetype="pdf") as doc:
+            for i in pages:
+                yield doc.get_page_text(i, "text", sort=True)
+        return
+    size  = -(-len(pages) // _POOL_WORKERS)                   # ceil
+    jobs  = [(str(pdf_path), pages[i:i + size]) for i in range(0, len(pages), size)]
+    for chunk in _get_page_pool().map(_extract_chunk, jobs):
+        yield from chunk
 
 # ───────────────────────── Event-Loop Helper (Thread-safe) ─────────────────
 def _ensure_loop() -> asyncio.AbstractEventLoop:
@@ -106,10 +171,32 @@ _SYS_MSG   = ("You classify bibliography lines. Reply with ONLY one word: "
 _GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4o-mini")
 _TIMEOUT   = float(os.getenv("GPT_TIMEOUT", "7"))
 _CACHE_TTL = 12 * 60 * 60                   # 12 h
-_STYLE_CACHE: dict[str, tuple[str, float]] = {}
+_CACHE_MAX = 1024
+# LRU mit TTL: sample-hash → (style, ts); begrenzt, da Worker lange laufen
+_STYLE_CACHE: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+_STYLE_LOCK  = threading.Lock()
+
+def _cache_get(key: str, now: float) -> Optional[str]:
+    with _STYLE_LOCK:
+        hit = _STYLE_CACHE.get(key)
+        if hit is None:
+            return None
+        if now - hit[1] >= _CACHE_TTL:              # abgelaufen → entfernen
+            del _STYLE_CACHE[key]
+            return None
+        _STYLE_CACHE.move_to_end(key)
+        return hit[0]
 
+def _cache_put(key: str, sty: str, now: float) -> None:
+    with _STYLE_LOCK:
+        _STYLE_CACHE[key] = (sty, now)
+        _STYLE_CACHE.move_to_end(key)
+        while len(_STYLE_CACHE) > _CACHE_MAX:       # ältesten Eintrag verwerfen
+            _STYLE_CACHE.popitem(last=False)
+
+@lru_cache(maxsize=256)
 def _sample_hash(txt: str) -> str:
-    return sha1(txt.encode()).hexdigest()[:12]
+    return blake2b(txt.encode(), digest_size=6).hexdigest()   # nur Cache-Key
 
 async def _gpt_detect(sample: str) -> str:
     if openai is None or not openai.api_key:
@@ -117,8 +204,8 @@ async def _gpt_detect(sample: str) -> str:
 
     key = _sample_hash(sample)
     now = time.time()
-    if (hit := _STYLE_CACHE.get(key)) and now - hit[1] < _CACHE_TTL:
-        return hit[0]
+    if (hit := _cache_get(key, now)) is not None:
+        return hit
 
     try:
         rsp = await asyncio.wait_for(
@@ -138,13 +225,15 @@ async def _gpt_detect(sample: str) -> str:
         LOG.warning("GPT style detect failed: %s", exc)
         sty = "unknown"
 
-    _STYLE_CACHE[key] = (sty, now)
+    _cache_put(key, sty, now)
     return sty
 
 # ───────────────────────── Fallback-Heuristik  ─────────────────────────────
+# Autoren enden an der ersten Ziffer ([^\d]+? statt .+?) → nur *ein* Jahr-Kandidat,
+# Verlag greedy bis $ → kein verschachteltes Backtracking auf langen OCR-Zeilen.
 _FALLBACK_RE = re.compile(
-    rf"^(?P<authors>.+?)\s+[–\-]?\s*(?P<year>{YEAR_RE.pattern})[a-z]?[.,:]?\s+"
-    rf"(?P<title>.+?)(?:\.\s+(?P<publisher>[^0-9]+?))?$", re.U)
+    rf"^(?P<authors>[^\d]+?)\s+[–\-]?\s*(?P<year>{YEAR_RE.pattern})[a-z]?[.,:]?\s+"
+    rf"(?P<title>.+?)(?:\.\s+(?P<publisher>[^0-9]+))?$", re.U)
 
 def _fallback_parse(line: str) -> Optional[Dict]:
     if (m := _FALLBACK_RE.match(line)):
@@ -168,18 +257,20 @@ def extract_references(
     line_parser: Callable[[str], Optional[Dict]] | None = None,
 ) -> List[Dict]:
     """liefert Liste sauberer Referenz-Dictionaries."""
-    # 1) Seiten-Text
-    page_txt: List[str] = []
-    with fitz.open(pdf_path) as doc:
-        for i in pages:
-            page_txt.append(doc.load_page(i).get_text("text", sort=True))
+    # 1) Seiten-Text  (Stream – nur die Seiten fürs Stil-Sample werden gepuffert)
+    texts = _iter_page_texts(pdf_path, pages)
+    head: List[str] = []
+    sample_lines: List[str] = []
+    for txt in texts:
+        head.append(txt)
+        sample_lines += [ln for ln in txt.splitlines() if ln.strip()]
+        if len(sample_lines) >= 12:
+            break
 
     # 2) Stil-Erkennung (Sample = erste 12 Non-Empty Zeilen)
-    sample_lines = [ln for t in page_txt for ln in t.splitlines() if ln.strip()][:12]
+    sample_lines = sample_lines[:12]
     sample       = "\n".join(sample_lines)
-    style        = next((n for n, p in _PATTERNS.items()
-                         if any(p.match(l) for l in sample_lines)),
-                        "unknown")
+    style        = _detect_style(sample_lines)
     # GPT-Fine-Tune
     if use_gpt and style == "unknown":
         loop  = _ensure_loop()
@@ -187,7 +278,9 @@ def extract_references(
 
     LOG.info("detected citation style: %s", style)
 
-    # 3) Parsing pro Seite  (Thread-Pool)
+    # 3) Parsing pro Seite  (Stil-Pattern einmal vorab auswählen)
+    style_re = _PATTERNS.get(style)
+
     def _parse_page(txt: str) -> List[Dict]:
         out: List[Dict] = []
         for raw in _merge_lines(txt):
@@ -198,8 +291,8 @@ def extract_references(
                 rec = line_parser(raw)
 
             # b) Regex gemäß Stil
-            if rec is None and style in _PATTERNS:
-                if (m := _PATTERNS[style].match(raw)):
+            if rec is None and style_re is not None:
+                if (m := style_re.match(raw)):
                     rec = {
                         "authors"  : _norm(m["authors"]),
                         "year"     : int(m["year"]),
@@ -214,16 +307,16 @@ def extract_references(
             # d) nur vollständige Einträge akzeptieren
             if rec and rec["authors"] and rec["title"]:
                 out.append(rec)
-                if os.getenv("REF_DEBUG") == "1":
+                if _REF_DEBUG:
                     LOG.debug("✓ %-38s  —  %-45s (%s)",
                               rec['authors'][:38], rec['title'][:45], rec['year'])
-            elif os.getenv("REF_DEBUG") == "1":
+            elif _REF_DEBUG:
                 LOG.debug("✗ skipped  «%s»", raw[:80])
         return out
 
+    # reines Regex-Parsing ist GIL-gebunden → sequentiell ohne Pool-Overhead
     refs: List[Dict] = []
-    with ThreadPoolExecutor(max_workers=4) as tp:
-        for chunk in tp.map(_parse_page, page_txt):
-            refs.extend(chunk)
+    for txt in chain(head, texts):
+        refs.extend(_parse_page(txt))
 
     return refs
\ No newline at end of file
@@ -13,10 +13,11 @@ import json
 import logging
 import os
 import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Tuple
+from uuid import uuid4
 
 from dotenv import load_dotenv
 from flask import (
@@ -31,7 +32,7 @@ from werkzeug.datastructures import FileStorage
 from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename, safe_join
 
-from services.ingesting_service import ingest_single      # 1-PDF-Pipeline
+from services.ingesting_service import ingest_batch       # Batch-Pipeline
 from services.read             import get_stats           # /lookup-Helper
 
 # ──────────────────────────  Konfiguration  ──────────────────────────────
@@ -46,6 +47,7 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 MAX_WORKERS  = int(os.getenv("WEB_WORKERS", os.cpu_count() or 4))
 MAX_SIZE_MB  = int(os.getenv("MAX_PDF_MB", "50"))
 ALLOWED_MIME = {"application/pdf"}
+SAVE_BUFSIZE = 1 << 20              # 1 MiB statt Werkzeug-Default 16 KiB
 
 # ──────────────────────────  Blueprint  ──────────────────────────────────
 upload_bp = Blueprint(
@@ -63,14 +65,28 @@ def _error(msg: str, code: int = 400):
     abort(code, msg)
 
 
+def _upload_size(f: FileStorage) -> int:
+    """
+    Größe ohne den Stream zu lesen: Part-Header, sonst seek/tell (O(1)).
+    Kein fileno()/fstat – das würde Werkzeugs SpooledTemporaryFile zum
+    Rollover auf die Platte zwingen.  Übergroße *Requests* weist bereits
+    MAX_CONTENT_LENGTH (run.py) vor dem Spoolen ab.
+    """
+    if f.content_length:
+        return f.content_length
+    pos = f.stream.tell()
+    f.stream.seek(0, os.SEEK_END)
+    size = f.stream.tell()
+    f.stream.seek(pos)
+    return size
+
+
 def _validate_file(f: FileStorage) -> None:
     """MIME- & Größen-Check; wirft Exception bei Fehler."""
     if f.mimetype not in ALLOWED_MIME:
         raise ValueError(f"Nur PDF erlaubt, nicht “{f.mimetype}”")
 
-    f.seek(0, os.SEEK_END)
-    size_mb = f.tell() / (1024 * 1024)
-    f.seek(0)
+    size_mb = _upload_size(f) / (1024 * 1024)
     if size_mb > MAX_SIZE_MB:
         raise RequestEntityTooLarge(f"Datei > {MAX_SIZE_MB} MB")
 
@@ -87,23 +103,25 @@ def _save_file(f: FileStorage) -> Path:
 
     stem      = Path(f.filename or "upload").stem
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    dst       = _safe_path(f"{stem}_{timestamp}.pdf")
+    # Saves laufen parallel → Suffix, damit gleichnamige Uploads derselben
+    # Sekunde nicht in dieselbe Datei schreiben
+    dst       = _safe_path(f"{stem}_{timestamp}_{uuid4().hex[:8]}.pdf")
 
-    f.save(dst)
+    f.save(dst, buffer_size=SAVE_BUFSIZE)
     LOG.debug("saved %s (%s bytes)", dst.name, dst.stat().st_size)
     return dst
 
 
-def _run_pipeline(pdf_path: Path) -> Tuple[str, Tuple[int, int] | None]:
+def _run_pipeline(paths: List[Path]) -> Dict[str, Tuple[int, int] | None]:
     """
-    1 · ingest_single() ⇒ legt alles in der DB an
-    2 · liefert (Dateiname, bounds | None)
+    1 · ingest_batch() ⇒ legt alle PDFs in *einer* DB-Transaktion an
+    2 · liefert {Dateiname: bounds | None}
     """
     try:
-        return ingest_single(pdf_path)
-    except Exception as exc:           # ingest-Fehler nicht abstürzen lassen
-        LOG.exception("Analyse fehlgeschlagen: %s", pdf_path.name)
-        return pdf_path.name, None
+        return dict(ingest_batch(paths, workers=MAX_WORKERS))
+    except Exception:                  # ingest-Fehler nicht abstürzen lassen
+        LOG.exception("Batch-Analyse fehlgeschlagen (%d PDFs)", len(paths))
+        return {p.name: None for p in paths}
 
 # ───────────────────────────  Routes  ────────────────────────────────────
 @upload_bp.route("/", methods=["GET", "POST"])
@@ -117,9 +135,10 @@ def index():
     if not files or files[0].filename == "":
         return _error("Keine Datei ausgewählt …")
 
-    # 2a · Dateien speichern
+    # 2a · Dateien speichern (parallel)
     try:
-        paths = [_save_file(f) for f in files]
+        with ThreadPoolExecutor(max_workers=min(len(files), MAX_WORKERS)) as pool:
+            paths = list(pool.map(_save_file, files))
     except (ValueError, RequestEntityTooLarge) as exc:
         LOG.warning("Upload abgewiesen: %s", exc)
         return _error(str(exc), 413)
@@ -127,13 +146,8 @@ def index():
         LOG.exception("Upload save failed")
         return _error(f"Upload fehlgeschlagen: {exc}", 500)
 
-    # 2b · Analyse parallel
-    results: Dict[str, Tuple[int, int] | None] = {}
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
-        futs = {pool.submit(_run_pipeline, p): p for p in paths}
-        for fut in as_completed(futs):
-            name, bounds = fut.result()
-            results[name] = bounds
+    # 2b · Analyse parallel, DB-Writes gebündelt
+    results = _run_pipeline(paths)
 
     LOG.info("Batch finished:\n%s",
              json.dumps(results, indent=2, ensure_ascii=False))
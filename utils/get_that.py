@@ -14,28 +14,37 @@ Funktion:
 - Strategie:
     1) Versuche Gesamt-PDF via https://www.e-periodica.ch/cntmng?pid=<PID>
     2) Falls nicht verfügbar: lade alle Seiten als IIIF-Bilder in korrekter Reihenfolge
-       (Identifier = <iiifSystemId>!<pageName>), Pfad: <iiifEndpoint>/IDENTIFIER/full/full/0/default.jpg
+       (Identifier = <iiifSystemId>!<pageName>), Pfad: <iiifEndpoint>/IDENTIFIER/full/!N,N/0/default.jpg
+       (N = max. Kantenlänge, Default 1600 px; 0 = Originalgröße)
     3) Baue daraus *ein* PDF, Dateiname = bereinigter Titel
 - Keine Konsolen-Inputs. Enthält ausführliche Debug-Prints.
 
 Voraussetzungen:
-    pip install requests beautifulsoup4 pypdf pillow
+    pip install requests img2pdf pillow
+    optional: pip install requests-cache   (Wiederholungsläufe aus lokalem Cache)
 Getestet mit Python 3.10+
 """
 
+import html
 import io
+import json
 import os
 import re
+import shutil
 import sys
+import tempfile
+import threading
 import time
-import random
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs, unquote
 
+import img2pdf
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
-from pypdf import PdfWriter, PdfReader
 
 # ------------------ GUI (keine Konsolen-Inputs) ------------------
 try:
@@ -45,6 +54,12 @@ try:
 except Exception:
     TK_OK = False
 
+# ------------------ HTTP-Cache (optional) ------------------
+try:
+    import requests_cache                    # pip install requests-cache
+except ModuleNotFoundError:
+    requests_cache = None
+
 # ------------------ Konfiguration ------------------
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -56,42 +71,98 @@ BASE = "https://www.e-periodica.ch"
 REQUEST_TIMEOUT = (10, 60)    # (connect, read) Sekunden
 MAX_RETRIES = 4
 BACKOFF_BASE = 1.7
+IIIF_WORKERS = int(os.getenv("IIIF_WORKERS", "8"))   # parallele Seiten-Downloads
+IIIF_RATE    = float(os.getenv("IIIF_RATE", "5"))     # max. IIIF-Requests/s (alle Threads)
+IIIF_MAX_PX  = int(os.getenv("IIIF_MAX_PX", "1600"))  # 1600 Bildschirm, 2400 Druck, 0 = full
+CACHE_PATH   = Path(os.getenv("EPERIODICA_CACHE", str(Path.home() / ".eperiodica_cache")))
+CACHE_TTL    = 24 * 60 * 60                  # 1 Tag
+CACHE_ON     = os.getenv("EPERIODICA_NO_CACHE", "0") != "1"
+FULL_PDF_MIN = 150_000                      # kleinere cntmng-PDFs = Platzhalter
+PDF_LAYOUT = img2pdf.get_fixed_dpi_layout_fun((300, 300))   # Seitengröße = px / 300 dpi
+
+# Bild-Signaturen (erste 2 Bytes): JPEG, PNG
+_VALID_IMG_PREFIXES = frozenset((b"\xff\xd8", b"\x89P"))
+
+# ------------------ Regex (einmal kompiliert) ------------------
+_RE_IIIF_SYS    = re.compile(r"window\.epdata\.iiifSystemId\s*=\s*'([^']+)'")
+_RE_IIIF_EP     = re.compile(r"window\.epdata\.iiifEndpointUri\s*=\s*'([^']+)'")
+_RE_PAGES_BLOCK = re.compile(r"pagesMinified\s*=\s*\[(.*?)\]\s*;", re.S | re.I)
+_RE_JPG_ENTRY   = re.compile(r"\[\s*'([^']+?\.jpg)'\s*,")
+_RE_JPG_ANY     = re.compile(r"'([^']+?\.jpg)'")
+_RE_SANITIZE    = re.compile(r"[^\w\-. ()\u00C0-\u017F]+", re.UNICODE)
+_RE_WS          = re.compile(r"\s+")
+# Löschtabelle der erlaubten ASCII-Zeichen (= \w - . Leerzeichen ( ) in ASCII)
+_ASCII_ALLOWED  = str.maketrans("", "", "".join(
+    c for c in map(chr, range(128)) if c.isalnum() or c in "_-. ()"))
+# Titel direkt aus dem HTML-Text (kein DOM-Aufbau)
+_RE_OG_TITLE    = re.compile(r"<meta\b[^>]*?\bproperty\s*=\s*[\"']og:title[\"'][^>]*>", re.I)
+_RE_CONTENT     = re.compile(r"\bcontent\s*=\s*(?:\"([^\"]*)\"|'([^']*)')", re.I)
+_RE_HEADING     = re.compile(r"<(h[12])\b[^>]*>(.*?)</\1\s*>", re.I | re.S)
+_RE_TITLE       = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.I | re.S)
+_RE_TAG         = re.compile(r"<[^>]+>")
 
 # ------------------ Hilfsfunktionen ------------------
-def dbg_sleep(attempt:int):
-    w = (BACKOFF_BASE ** attempt) + random.uniform(0, 0.6)
-    print(f"[DEBUG] Backoff {w:.2f}s …")
-    time.sleep(w)
+class TokenBucket:
+    """Thread-sicheres Rate-Limit: <rate> Tokens/s, Burst bis <capacity>."""
+    def __init__(self, rate:float, capacity:float):
+        self.rate, self.capacity = rate, capacity
+        self.tokens = capacity
+        self.stamp  = time.monotonic()
+        self.lock   = threading.Lock()
+
+    def take(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp  = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_iiif_bucket = TokenBucket(rate=IIIF_RATE, capacity=10)
 
 def session() -> requests.Session:
-    s = requests.Session()
+    # Wiederholte Läufe (z.B. nach Abbruch) → HTML aus SQLite-Cache, danach
+    # per ETag/Cache-Control revalidiert.  Gesamt-PDF und IIIF-Bilder bleiben
+    # draußen: requests-cache würde sie vor dem Streamen komplett einlesen
+    if requests_cache is not None and CACHE_ON:
+        host = urlparse(BASE).netloc
+        s = requests_cache.CachedSession(
+            cache_name=str(CACHE_PATH), backend="sqlite",
+            expire_after=CACHE_TTL, cache_control=True,
+            allowable_methods=("GET", "HEAD"),
+            urls_expire_after={
+                f"{host}/cntmng*": requests_cache.DO_NOT_CACHE,
+                "*/iiif/*":        requests_cache.DO_NOT_CACHE,
+            })
+        print(f"[DEBUG] HTTP-Cache: {CACHE_PATH}.sqlite")
+    else:
+        s = requests.Session()
     s.headers.update({"User-Agent": USER_AGENT, "Accept": "*/*"})
+    # Keep-Alive-Pool groß genug für alle Download-Threads; Retry/Backoff
+    # (inkl. Retry-After) erledigt urllib3 direkt im Adapter
+    retry = Retry(total=MAX_RETRIES, backoff_factor=BACKOFF_BASE,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(("GET", "HEAD")),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(16, IIIF_WORKERS),
+                          max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
     return s
 
 def http_get(s:requests.Session, url:str, stream=False) -> requests.Response:
-    for i in range(1, MAX_RETRIES+1):
-        try:
-            print(f"[DEBUG] GET {i}/{MAX_RETRIES}: {url}")
-            r = s.get(url, timeout=REQUEST_TIMEOUT, allow_redirects=True, stream=stream)
-            if r.status_code in (200, 206):
-                return r
-            if r.status_code in (429, 500, 502, 503, 504):
-                print(f"[WARN] Server-Status {r.status_code} – erneuter Versuch …")
-                dbg_sleep(i)
-                continue
-            print(f"[ERROR] Unerwarteter Status {r.status_code} für {url}")
-            return r
-        except requests.RequestException as e:
-            print(f"[ERROR] Netzfehler: {e}")
-            dbg_sleep(i)
-    raise RuntimeError(f"Konnte {url} nach {MAX_RETRIES} Versuchen nicht laden.")
-
-def http_head(s:requests.Session, url:str) -> requests.Response | None:
+    print(f"[DEBUG] GET: {url}")
     try:
-        print(f"[DEBUG] HEAD: {url}")
-        return s.head(url, timeout=REQUEST_TIMEOUT, allow_redirects=True)
-    except requests.RequestException:
-        return None
+        r = s.get(url, timeout=REQUEST_TIMEOUT, allow_redirects=True, stream=stream)
+    except requests.RequestException as e:
+        raise RuntimeError(f"Konnte {url} nach {MAX_RETRIES} Versuchen nicht laden: {e}") from e
+    if r.status_code not in (200, 206):
+        print(f"[ERROR] Unerwarteter Status {r.status_code} für {url}")
+    return r
 
 def is_pdf_response(resp:requests.Response) -> bool:
     ctype = (resp.headers.get("Content-Type") or "").lower()
@@ -99,8 +170,13 @@ def is_pdf_response(resp:requests.Response) -> bool:
     return ("application/pdf" in ctype) or (".pdf" in disp)
 
 def sanitize_filename(name:str) -> str:
-    name = re.sub(r"[^\w\-. ()\u00C0-\u017F]+", "_", name, flags=re.UNICODE)
-    name = re.sub(r"\s+", " ", name).strip()
+    # ASCII-Fast-Path: translate (C-Tabelle) löscht alle erlaubten Zeichen –
+    # bleibt nichts übrig, ist keine Ersetzung nötig; sonst Regex, damit
+    # Folgen unerlaubter Zeichen weiterhin zu *einem* "_" werden
+    if not (name.isascii() and not name.translate(_ASCII_ALLOWED)):
+        name = _RE_SANITIZE.sub("_", name)
+    # nach der Ersetzung ist " " das einzige Whitespace-Zeichen
+    name = " ".join(name.split())
     return name[:200] or "eperiodica_document"
 
 def extract_pid(url:str) -> str | None:
@@ -115,7 +191,7 @@ def extract_pid(url:str) -> str | None:
         print(f"[WARN] PID konnte nicht extrahiert werden: {e}")
     return None
 
-def pick_url_and_folder() -> tuple[str, Path]:
+def pick_url_and_folder() -> tuple[str, Path, int]:
     if not TK_OK:
         raise RuntimeError("Tkinter nicht verfügbar – bitte Python mit Tk-Unterstützung verwenden.")
     root = tk.Tk(); root.withdraw()
@@ -126,193 +202,247 @@ def pick_url_and_folder() -> tuple[str, Path]:
     outdir = filedialog.askdirectory(title="Zielordner wählen")
     if not outdir:
         raise RuntimeError("Kein Zielordner gewählt.")
-    return url.strip(), Path(outdir)
+    max_px = simpledialog.askinteger(
+        "Bildgröße", "Max. Kantenlänge der Seitenbilder in px\n"
+        "(1600 = Bildschirm, 2400 = Druck, 0 = Original):",
+        initialvalue=IIIF_MAX_PX, minvalue=0)
+    return url.strip(), Path(outdir), IIIF_MAX_PX if max_px is None else max_px
 
 # ------------------ HTML-Parsing ------------------
-def load_html(s:requests.Session, url:str) -> BeautifulSoup | None:
-    r = http_get(s, url, stream=False)
-    if r.status_code != 200 or "text/html" not in (r.headers.get("Content-Type") or ""):
-        print(f"[WARN] Keine HTML-Antwort (Status {r.status_code})")
-        return None
-    return BeautifulSoup(r.text, "html.parser")
-
-def extract_title(soup:BeautifulSoup) -> str:
-    og = soup.find("meta", attrs={"property":"og:title"})
-    if og and og.get("content"):
-        t = og["content"].strip()
-        print(f"[DEBUG] Titel (og:title): {t}")
-        return t
-    h1 = soup.find(["h1","h2"])
-    if h1 and h1.get_text(strip=True):
-        t = h1.get_text(" ", strip=True)
+def _html_text(fragment:str) -> str:
+    """Tags raus, Entities auflösen, Whitespace normalisieren."""
+    return _RE_WS.sub(" ", html.unescape(_RE_TAG.sub(" ", fragment))).strip()
+
+def extract_title(html_text:str) -> str:
+    if (og := _RE_OG_TITLE.search(html_text)) and (c := _RE_CONTENT.search(og.group())):
+        t = html.unescape(c.group(1) if c.group(1) is not None else c.group(2)).strip()
+        if t:
+            print(f"[DEBUG] Titel (og:title): {t}")
+            return t
+    if (h := _RE_HEADING.search(html_text)) and (t := _html_text(h.group(2))):
         print(f"[DEBUG] Titel (h1/h2): {t}")
         return t
-    if soup.title and soup.title.get_text(strip=True):
-        t = soup.title.get_text(" ", strip=True)
+    if (m := _RE_TITLE.search(html_text)) and (t := _html_text(m.group(1))):
         print(f"[DEBUG] Titel (<title>): {t}")
         return t
     print("[WARN] Kein Titel gefunden – nutze 'E-Periodica Dokument'")
     return "E-Periodica Dokument"
 
+def parse_pages_minified(data:str) -> list[str]:
+    """
+    pagesMinified ist ein JS-Array-Literal ([['…_0001.jpg', …], …]) → nach
+    Quote-Tausch direkt mit dem C-JSON-Parser lesen; nur wenn das scheitert
+    (Quotes/Escapes im Inhalt, JS-Syntax) greift die Regex.
+    """
+    # Quote-Tausch nur, wenn er eindeutig ist: \' oder " im Inhalt würden
+    # zu gültigem JSON mit verfälschter ID → dann direkt die Regex
+    if "\\'" in data or '"' in data:
+        return _RE_JPG_ENTRY.findall(data)
+    try:
+        rows = json.loads("[" + data.replace("'", '"') + "]")
+        pages = [r[0] for r in rows
+                 if isinstance(r, list) and r and isinstance(r[0], str) and r[0].endswith(".jpg")]
+        if pages:
+            return pages
+    except ValueError:
+        pass
+    return _RE_JPG_ENTRY.findall(data)
+
 def extract_epdata_values(html_text:str) -> tuple[str | None, str | None, list[str]]:
     """
     Holt iiifSystemId, iiifEndpointUri und die List der Seiten-JPG-IDs aus window.epdata.pagesMinified.
     Wir parsen robust via Regex, ohne auf JS-JSON-Syntax angewiesen zu sein.
     """
     # iiifSystemId
-    m_sys = re.search(r"window\.epdata\.iiifSystemId\s*=\s*'([^']+)'", html_text)
+    m_sys = _RE_IIIF_SYS.search(html_text)
     iiif_system = m_sys.group(1) if m_sys else None
     print(f"[DEBUG] iiifSystemId: {iiif_system}")
 
     # iiifEndpointUri
-    m_ep = re.search(r"window\.epdata\.iiifEndpointUri\s*=\s*'([^']+)'", html_text)
+    m_ep = _RE_IIIF_EP.search(html_text)
     iiif_endpoint = m_ep.group(1) if m_ep else None
     print(f"[DEBUG] iiifEndpointUri: {iiif_endpoint}")
 
     # pagesMinified: alle '...jpg' in der initialisierten Array einsammeln (Reihenfolge beibehalten)
-    pages = []
-    # Bereich der pagesMinified isolieren, um false-positive zu minimieren
-    block = re.search(r"pagesMinified\s*=\s*\[(.*?)\]\s*;", html_text, flags=re.S|re.I)
+    # Bereich der pagesMinified isolieren, um false-positive zu minimieren;
+    # str.find (C) springt zum Token, die Regex läuft erst ab dort
+    start = html_text.find("pagesMinified")
+    block = _RE_PAGES_BLOCK.search(html_text, max(start, 0))
     if block:
-        data = block.group(1)
-        for m in re.finditer(r"\[\s*'([^']+?\.jpg)'\s*,", data):
-            pages.append(m.group(1))
+        pages = parse_pages_minified(block.group(1))
     else:
         print("[WARN] pagesMinified nicht gefunden – versuche generisches JPG-Muster (Fallback).")
-        for m in re.finditer(r"'([^']+?\.jpg)'", html_text):
-            pages.append(m.group(1))
+        pages = _RE_JPG_ANY.findall(html_text)
     # Deduplizieren, Reihenfolge bewahren
-    seen = set(); ordered = []
-    for x in pages:
-        if x not in seen:
-            ordered.append(x); seen.add(x)
+    ordered = list(dict.fromkeys(pages))
     print(f"[DEBUG] Seiten gefunden: {len(ordered)}")
     return iiif_system, iiif_endpoint, ordered
 
 # ------------------ Download & PDF-Bau ------------------
-def try_download_full_pdf(s:requests.Session, pid:str) -> bytes | None:
+# umask einmalig beim Import lesen (os.umask setzt sie dabei kurz um)
+_UMASK = os.umask(0); os.umask(_UMASK)
+
+@contextmanager
+def atomic_write(dst:Path):
+    """
+    Schreibt in eine Temp-Datei neben <dst> und benennt erst bei Erfolg per
+    os.replace um – keine halben PDFs, kein komplettes Dokument im RAM.
+    """
+    fh = tempfile.NamedTemporaryFile(dir=dst.parent, prefix=f".{dst.stem}.",
+                                     suffix=".part", delete=False)
+    try:
+        with fh:
+            yield fh
+        # NamedTemporaryFile legt 0600 an → Rechte wie bei open() (umask)
+        os.chmod(fh.name, 0o666 & ~_UMASK)
+        os.replace(fh.name, dst)
+    except BaseException:
+        Path(fh.name).unlink(missing_ok=True)
+        raise
+
+def try_download_full_pdf(s:requests.Session, pid:str, out_file:Path) -> bool:
     cnt = f"{BASE}/cntmng?pid={requests.utils.quote(pid, safe=':/')}"
-    # HEAD
-    h = http_head(s, cnt)
-    if h is not None and h.status_code == 200 and ("application/pdf" in (h.headers.get("Content-Type","").lower())):
-        print("[INFO] Gesamt-PDF via cntmng (HEAD bestätigt) – lade …")
-        return stream_to_bytes(s, cnt)
-    # direkter GET-Fallback
+    # *ein* gestreamter GET: Header entscheiden, Body wird nur bei PDF gelesen
     r = http_get(s, cnt, stream=True)
-    if is_pdf_response(r):
-        print("[INFO] Gesamt-PDF via cntmng (GET bestätigt) – lade …")
-        return stream_iter_to_bytes(r)
+    with r:
+        if r.status_code in (200, 206) and is_pdf_response(r):
+            print("[INFO] Gesamt-PDF via cntmng (GET bestätigt) – lade …")
+            with atomic_write(out_file) as fh:
+                size = stream_iter_to_file(r, fh)
+                if size <= FULL_PDF_MIN:
+                    raise RuntimeError(f"Gesamt-PDF nur {size} Bytes – vermutlich Platzhalter")
+            return True
     print("[INFO] Kein Gesamt-PDF unter /cntmng – wechsle auf IIIF-Seitenmodus.")
-    return None
+    return False
 
-def stream_to_bytes(s:requests.Session, url:str) -> bytes:
-    r = http_get(s, url, stream=True)
-    return stream_iter_to_bytes(r)
-
-def stream_iter_to_bytes(resp:requests.Response) -> bytes:
-    out = io.BytesIO()
-    size = 0
-    for chunk in resp.iter_content(chunk_size=1024*256):
-        if chunk:
-            out.write(chunk)
-            size += len(chunk)
-            sys.stdout.write(f"\r[DEBUG] lade … {size/1024:.1f} KiB")
+def fetch_bytes(s:requests.Session, url:str) -> bytes:
+    """
+    Body in *einem* Puffer (urllib3 dekodiert gzip/deflate) – ohne
+    BytesIO/getvalue-Kopien und ohne Fortschritts-Ausgabe pro Chunk.
+    """
+    with http_get(s, url, stream=True) as r:
+        r.raw.decode_content = True
+        return r.raw.read()
+
+class ProgressReader:
+    """Wrappt einen Stream; meldet den Fortschritt höchstens alle 2 MiB."""
+    STEP = 2 << 20
+
+    def __init__(self, raw):
+        self.raw, self.size, self._next = raw, 0, self.STEP
+
+    def read(self, n:int = -1) -> bytes:
+        data = self.raw.read(n)
+        self.size += len(data)
+        if self.size >= self._next:
+            self._next += self.STEP
+            sys.stdout.write(f"\r[DEBUG] lade … {self.size/1024:.1f} KiB")
             sys.stdout.flush()
-    sys.stdout.write("\n")
-    return out.getvalue()
-
-def iiif_image_url(iiif_endpoint:str, iiif_system:str, page_jpg_id:str) -> str:
+        return data
+
+def stream_iter_to_file(resp:requests.Response, fh) -> int:
+    # Kopierschleife in C (shutil) mit 1-MiB-Puffer statt iter_content
+    resp.raw.decode_content = True
+    src = ProgressReader(resp.raw)
+    shutil.copyfileobj(src, fh, length=1 << 20)
+    sys.stdout.write(f"\r[DEBUG] geladen: {src.size/1024:.1f} KiB\n")
+    return src.size
+
+def iiif_image_urls(iiif_endpoint:str, iiif_system:str, page_jpg_ids:list[str],
+                    max_pixels:int = IIIF_MAX_PX) -> list[str]:
     """
-    Baut eine Vollauflösungs-IIIF-URL:
-      <endpoint>/<system>!<page>.jpg/full/full/0/default.jpg
+    Baut die IIIF-URLs aller Seiten, skaliert auf max. <max_pixels> Kantenlänge:
+      <endpoint>/<system>!<page>.jpg/full/!N,N/0/default.jpg
     Beispiel aus og:image:
       https://www.e-periodica.ch/iiif/2/e-periodica!szg!1959_009!szg-006_1959_009_0001.jpg/full/!1200,1200/0/default.jpg
-    Wir nehmen 'full/full' für maximale Größe.
+    '!' = „einpassen“ → der Server liefert ein vorskaliertes Derivat statt des
+    (oft mehrere MB großen) Originals. max_pixels=0 → 'full/full'.
+    Präfix/Suffix werden einmal gebaut, pro Seite bleibt eine Konkatenation.
     """
-    ident = f"{iiif_system}!{page_jpg_id}"
     # Wichtig: keine doppelte Slash-Probleme
-    return f"{iiif_endpoint.rstrip('/')}/{ident}/full/full/0/default.jpg"
+    prefix = f"{iiif_endpoint.rstrip('/')}/{iiif_system}!"
+    size   = f"!{max_pixels},{max_pixels}" if max_pixels > 0 else "full"
+    suffix = f"/full/{size}/0/default.jpg"
+    return [prefix + page_id + suffix for page_id in page_jpg_ids]
 
-def image_bytes_to_pdf_page(img_bytes: bytes) -> bytes:
+def as_jpeg(img_bytes: bytes) -> bytes:
+    """
+    JPEG wird unverändert (ohne Re-Encode) ins PDF eingebettet;
+    alles andere (selten: PNG, Alpha, …) einmalig via Pillow nach JPEG.
+    """
+    if img_bytes[:2] == b"\xff\xd8":
+        return img_bytes
     im = Image.open(io.BytesIO(img_bytes)).convert("RGB")
     buf = io.BytesIO()
-    im.save(buf, format="PDF", resolution=300.0)
+    im.save(buf, format="JPEG", quality=90)
     return buf.getvalue()
 
-def merge_pdfs(pages:list[bytes]) -> bytes:
-    writer = PdfWriter()
-    for idx, blob in enumerate(pages, start=1):
-        print(f"[DEBUG] füge Seite {idx} hinzu …")
-        reader = PdfReader(io.BytesIO(blob))
-        for i in range(len(reader.pages)):
-            writer.add_page(reader.pages[i])
-    out = io.BytesIO()
-    writer.write(out)
-    return out.getvalue()
-
 # ------------------ Hauptprozess ------------------
-def build_pdf_from_html(s:requests.Session, url:str, out_dir:Path):
+def build_pdf_from_html(s:requests.Session, url:str, out_dir:Path,
+                        max_pixels:int = IIIF_MAX_PX):
     print("[INFO] Lade HTML und extrahiere Metadaten …")
     r = http_get(s, url, stream=False)
     if r.status_code != 200 or "text/html" not in (r.headers.get("Content-Type") or ""):
         raise RuntimeError(f"HTML nicht ladbar (Status {r.status_code})")
 
-    soup = BeautifulSoup(r.text, "html.parser")
-    title = sanitize_filename(extract_title(soup))
+    title = sanitize_filename(extract_title(r.text))
     pid = extract_pid(url)
     iiif_system, iiif_endpoint, pages = extract_epdata_values(r.text)
 
-    # 1) Gesamt-PDF versuchen
-    full_pdf = None
+    out_file = (out_dir / f"{title}.pdf")
+
+    # 1) Gesamt-PDF versuchen (direkt auf Platte gestreamt)
     if pid:
         try:
-            full_pdf = try_download_full_pdf(s, pid)
+            if try_download_full_pdf(s, pid, out_file):
+                print(f"[INFO] Gesamt-PDF gespeichert: {out_file}")
+                return
         except Exception as e:
             print(f"[WARN] cntmng-Download fehlgeschlagen: {e}")
 
-    if full_pdf and len(full_pdf) > 150_000:
-        out_file = (out_dir / f"{title}.pdf")
-        out_file.write_bytes(full_pdf)
-        print(f"[INFO] Gesamt-PDF gespeichert: {out_file}")
-        return
-
     # 2) IIIF-Bilder laden
     if not iiif_system or not iiif_endpoint or not pages:
         raise RuntimeError("Fehlende IIIF-Daten oder Seitenliste – Abbruch.")
 
     print(f"[INFO] Lade {len(pages)} Seitenbilder über IIIF und baue PDF …")
-    page_pdf_blobs: list[bytes] = []
-    for idx, page_id in enumerate(pages, start=1):
-        page_url = iiif_image_url(iiif_endpoint, iiif_system, page_id)
-        print(f"[DEBUG] ({idx}/{len(pages)}) IIIF: {page_url}")
+    urls = iiif_image_urls(iiif_endpoint, iiif_system, pages, max_pixels)
+
+    def fetch_page(job: tuple[int, str]) -> bytes | None:
+        """Download → Prüfung → JPEG in einem Worker: Netz und CPU überlappen."""
+        idx, page_url = job
+        print(f"[DEBUG] ({idx}/{len(urls)}) IIIF: {page_url}")
         try:
-            img_bytes = stream_to_bytes(s, page_url)
+            _iiif_bucket.take()                 # höflich: geteiltes Rate-Limit
+            img_bytes = fetch_bytes(s, page_url)
             # Validierung grob
-            if not img_bytes or img_bytes[:2] not in (b"\xff\xd8", b"\x89P"):  # JPEG/PNG
+            if img_bytes[:2] not in _VALID_IMG_PREFIXES:      # leer → b"" ∉ Set
                 print(f"[WARN] Unerwarteter Bildtyp/leer – konvertiere trotzdem.")
-            pdf_page = image_bytes_to_pdf_page(img_bytes)
-            page_pdf_blobs.append(pdf_page)
+            return as_jpeg(img_bytes)
         except Exception as e:
             print(f"[ERROR] Seite {idx}: {e} – überspringe.")
-        # höfliche Pause
-        time.sleep(0.4 + random.uniform(0.1, 0.4))
+            return None
+
+    # Token-Bucket = Rate-Limit; map() liefert in Seiten-Reihenfolge
+    with ThreadPoolExecutor(max_workers=IIIF_WORKERS) as ex:
+        jpeg_blobs = [b for b in ex.map(fetch_page, enumerate(urls, start=1)) if b]
 
-    if not page_pdf_blobs:
+    if not jpeg_blobs:
         raise RuntimeError("Keine Seiten verarbeitet – PDF kann nicht gebaut werden.")
 
-    merged = merge_pdfs(page_pdf_blobs)
-    out_file = (out_dir / f"{title}.pdf")
-    out_file.write_bytes(merged)
+    # img2pdf bettet die JPEG-Streams 1:1 ein (kein Decode, kein PDF-Merge)
+    with atomic_write(out_file) as fh:
+        img2pdf.convert(jpeg_blobs, layout_fun=PDF_LAYOUT, outputstream=fh)
     print(f"[INFO] Zusammengeführtes PDF gespeichert: {out_file}")
 
 def main():
     print("[INFO] E-Periodica 1-Link→1-PDF gestartet")
     s = session()
-    url, out_dir = pick_url_and_folder()
+    url, out_dir, max_px = pick_url_and_folder()
     out_dir.mkdir(parents=True, exist_ok=True)
     print(f"[INFO] Zielordner: {out_dir}")
     print(f"[INFO] Eingabe-URL: {url}")
-    build_pdf_from_html(s, url, out_dir)
+    print(f"[INFO] IIIF max. Kantenlänge: {max_px or 'Original'} px")
+    build_pdf_from_html(s, url, out_dir, max_px)
     print("[INFO] Fertig. Viel Spass!")
 
 if __name__ == "__main__":